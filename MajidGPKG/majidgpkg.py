@@ -33,28 +33,79 @@ import sqlite3
 import re
 import tempfile
 import shutil
-from contextlib import closing
+import time
+from contextlib import closing, contextmanager
 from datetime import datetime
 
-from osgeo import gdal
+from osgeo import gdal, ogr
 from qgis.PyQt.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
     QFileDialog, QCheckBox, QMessageBox, QAction, QProgressBar,
-    QGroupBox, QTextEdit, QSplitter, QInputDialog, QApplication
+    QGroupBox, QPlainTextEdit, QSplitter, QInputDialog, QApplication, QWidget
 )
 from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtCore import Qt, QThread, pyqtSignal
+from qgis.PyQt.QtCore import Qt, QEvent, QThread, QTimer, pyqtSignal
 from qgis.core import (
     Qgis, QgsProject, QgsMapLayerType, QgsDataProvider, QgsProviderRegistry,
-    QgsVectorFileWriter, QgsFields, QgsMessageLog, QgsApplication,
+    QgsVectorFileWriter, QgsFields, QgsMessageLog,
     QgsRasterFileWriter, QgsRasterPipe, QgsRasterProjector, QgsRasterBlockFeedback,
     QgsRenderContext, QgsVectorLayer, QgsRasterLayer, QgsMapLayer,
-    QgsLayerTree, QgsReadWriteContext, QgsMapLayerStyle, QgsLayerTreeLayer,
+    QgsLayerTree, QgsReadWriteContext, QgsLayerTreeLayer,
     QgsMapSettings, QgsSymbol, QgsSingleSymbolRenderer, QgsCategorizedSymbolRenderer,
     QgsGraduatedSymbolRenderer, QgsLayerTreeGroup
 )
 from qgis.PyQt.QtXml import QDomDocument
 
+# Patterns used to clean project, layer and file names
+_NON_WORDSPACE = re.compile(r'[^\w\s-]')
+_UNDERSCORES = re.compile(r'_+')
+_NON_SQLNAME = re.compile(r'[^a-zA-Z0-9_]')
+_NON_FILENAME = re.compile(r'[^\w\-_.]')
+_NON_WORD = re.compile(r'[^\w]')
+
+# Providers whose layers can't be stored in a GeoPackage (kept in the project)
+_UNSUPPORTED_PROVIDERS = frozenset({
+    'wms', 'wfs', 'wcs', 'wmts', 'arcgismapserver',
+    'arcgisfeatureserver', 'vectortile', 'mesh', 'pointcloud'
+})
+
+# Seconds between log message batches sent from the packaging thread
+MESSAGE_FLUSH_INTERVAL = 0.25
+
+# Milliseconds between log area updates in the dialog
+LOG_FLUSH_INTERVAL_MS = 150
+
+# Lines kept in the dialog log area, older lines are dropped
+LOG_MAX_LINES = 500
+
+# Minimum seconds between progress bar repaints in the dialog
+PROGRESS_UPDATE_INTERVAL = 0.1
+
+# Web service providers counted as non-packageable by the dialog
+_WEB_SERVICE_PROVIDERS = re.compile(r'wms|wfs|wcs|wmts|arcgismapserver')
+
+# GeoPackage metadata tables that reference a tile table by name
+# (besides gpkg_contents, which also holds its identifier)
+_TILE_TABLE_REFERENCES = ('gpkg_tile_matrix_set', 'gpkg_tile_matrix', 'gpkg_extensions')
+
+# Vector features copied per GeoPackage transaction (ogr2ogr's -gt)
+FEATURES_PER_TRANSACTION = 100000
+
+# SQLite settings GDAL applies to the GeoPackage connections it opens while
+# packaging
+GPKG_WRITE_CONFIG = {
+    'OGR_SQLITE_CACHE': '512',  # MB
+    'OGR_SQLITE_PRAGMA': 'temp_store=MEMORY',
+}
+
+# Extra settings used only when the run creates the GeoPackage: without a
+# rollback journal or fsync an interrupted run can leave the file corrupt,
+# which is only acceptable while it holds nothing but this run's output
+GPKG_NEW_FILE_CONFIG = {
+    'OGR_SQLITE_SYNCHRONOUS': 'OFF',
+    'OGR_SQLITE_JOURNAL': 'MEMORY',
+}
+
 
 class PackagingThread(QThread):
     """Thread for packaging operations to prevent UI freezing"""
@@ -69,6 +120,10 @@ class PackagingThread(QThread):
         self.store_project = store_project
         self.project_name = project_name
         self.canceled = False
+        self._conn = None
+        self._pending_msgs = []
+        self._last_flush = 0.0
+        self._last_progress = -1
     
     def run(self):
         try:
@@ -76,10 +131,19 @@ class PackagingThread(QThread):
             tc = original_project.transformContext()
             reg = QgsProviderRegistry.instance()
             
-            # Check if GeoPackage file exists and is writable
-            if os.path.exists(self.gpkg_path) and not os.access(self.gpkg_path, os.W_OK):
-                 self.finished_signal.emit(False, f"GeoPackage file is not writable: {self.gpkg_path}")
-                 return
+            # An existing GeoPackage must accept a write lock; this reports permission
+            # and lock errors from SQLite itself
+            existing_tables = set()
+            gpkg_exists = os.path.exists(self.gpkg_path)
+            if gpkg_exists:
+                try:
+                    conn = self._gpkg_connection()
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("ROLLBACK")
+                except (sqlite3.Error, PermissionError) as e:
+                    self._finish(False, f"GeoPackage file is not writable: {self.gpkg_path} ({str(e)})")
+                    return
+                existing_tables = list_gpkg_tables(conn)
             
             layers = list(original_project.mapLayers().values())
             
@@ -97,62 +161,78 @@ class PackagingThread(QThread):
             total_non_packageable = len(non_packageable_layers)
             
             if total_packageable == 0 and total_non_packageable == 0:
-                self.finished_signal.emit(False, "No layers found in the project to package.")
+                self._finish(False, "No layers found in the project to package.")
                 return
             
             # Log layer counts
             if total_non_packageable > 0:
                 non_packageable_names = [lyr.name() for lyr in non_packageable_layers]
-                self.message.emit(f"📋 Found {total_packageable} packageable layers and {total_non_packageable} non-packageable layers (WMS, etc.)")
-                self.message.emit(f"⚠️ Non-packageable layers will be preserved in project: {', '.join(non_packageable_names[:3])}{'...' if len(non_packageable_names) > 3 else ''}")
+                self._log(f"📋 Found {total_packageable} packageable layers and {total_non_packageable} non-packageable layers (WMS, etc.)")
+                self._log(f"⚠️ Non-packageable layers will be preserved in project: {', '.join(non_packageable_names[:3])}{'...' if len(non_packageable_names) > 3 else ''}")
             else:
-                self.message.emit(f"Packaging {total_packageable} supported layers...")
+                self._log(f"Packaging {total_packageable} supported layers...")
             
             processed_layers = []
+            packaged_names = []
+            preserved_names = []
             failed_layers = []
             
             # First package only the packageable layers
-            for i, lyr in enumerate(packageable_layers):
-                if self.canceled:
-                    self.message.emit("Packaging canceled")
-                    self.finished_signal.emit(False, "Packaging canceled by user")
-                    return
+            with gpkg_write_options(not gpkg_exists):
+                for i, lyr in enumerate(packageable_layers):
+                    if self.canceled:
+                        self._log("Packaging canceled")
+                        self._finish(False, "Packaging canceled by user")
+                        return
 
-                layername = lyr.name()
+                    layername = lyr.name()
                 
-                # Use a cleaned name for the GeoPackage table name
-                gpkg_layer_name = self.clean_layer_name(layername) 
+                    # Use a cleaned name for the GeoPackage table name
+                    gpkg_layer_name = self.clean_layer_name(layername) 
 
-                if not is_layer_in_gpkg(self.gpkg_path, gpkg_layer_name):
-                    self.message.emit(f"Processing layer {i+1}/{total_packageable}: {layername} (as table '{gpkg_layer_name}')")
+                    if gpkg_layer_name.lower() not in existing_tables:
+                        self._log(f"Processing layer {i+1}/{total_packageable}: {layername} (as table '{gpkg_layer_name}')")
                     
-                    # Store layer using the cleaned name
-                    err = write_layer(lyr, self.gpkg_path, tc, gpkg_layer_name)
+                        # Store layer using the cleaned name; show the queued
+                        # messages before the write blocks this thread
+                        self._flush_messages()
+                        err = write_layer(lyr, self.gpkg_path, tc, gpkg_layer_name, gpkg_exists)
                     
-                    if err[0]:
-                        error_msg = f"Error processing {layername}: {err[1]}"
-                        self.message.emit(f"❌ {error_msg}")
-                        failed_layers.append(layername)
-                        continue
+                        if err[0]:
+                            error_msg = f"Error processing {layername}: {err[1]}"
+                            self._log(f"❌ {error_msg}")
+                            failed_layers.append(layername)
+                            continue
+                        else:
+                            gpkg_exists = True
+                            # Later layers that clean to the same name reuse this table
+                            existing_tables.add(gpkg_layer_name.lower())
+                            self._log(f"✅ Successfully packaged {layername}")
+                            # Build the RTree in one pass now that the table is filled, so an
+                            # interrupted run never leaves a packaged table without one
+                            if lyr.type() == QgsMapLayerType.VectorLayer and lyr.isSpatial():
+                                self._flush_messages()
+                                if not create_spatial_index(self.gpkg_path, gpkg_layer_name):
+                                    self._log(f"⚠️ Could not build spatial index for table '{gpkg_layer_name}'")
+                            processed_layers.append({
+                                'original_layer': lyr,
+                                'gpkg_name': gpkg_layer_name,
+                                'original_name': layername,
+                                'is_packageable': True
+                            })
+                            packaged_names.append(layername)
                     else:
-                        self.message.emit(f"✅ Successfully packaged {layername}")
+                        self._log(f"⚠️ Layer {layername} (table '{gpkg_layer_name}') already exists in GeoPackage")
                         processed_layers.append({
                             'original_layer': lyr,
                             'gpkg_name': gpkg_layer_name,
                             'original_name': layername,
                             'is_packageable': True
                         })
-                else:
-                    self.message.emit(f"⚠️ Layer {layername} (table '{gpkg_layer_name}') already exists in GeoPackage")
-                    processed_layers.append({
-                        'original_layer': lyr,
-                        'gpkg_name': gpkg_layer_name,
-                        'original_name': layername,
-                        'is_packageable': True
-                    })
+                        packaged_names.append(layername)
                 
-                progress = int((i + 1) / total_packageable * 80)  # 80% for packageable layers
-                self.progress.emit(progress)
+                    progress = int((i + 1) / total_packageable * 80)  # 80% for packageable layers
+                    self._set_progress(progress)
 
             # Add non-packageable layers to the processed list (they won't be stored in GPKG but will be in project)
             for lyr in non_packageable_layers:
@@ -162,27 +242,31 @@ class PackagingThread(QThread):
                     'original_name': lyr.name(),
                     'is_packageable': False
                 })
-                self.message.emit(f"📌 Preserving non-packageable layer in project: {lyr.name()}")
+                preserved_names.append(lyr.name())
+                self._log(f"📌 Preserving non-packageable layer in project: {lyr.name()}")
 
             # Save project inside GeoPackage (optional)
             project_name_used = None
             if self.store_project:
-                self.progress.emit(85)
-                self.message.emit("Saving project to GeoPackage...")
+                self._set_progress(85)
+                self._log("Saving project to GeoPackage...")
+                self._flush_messages()
                 
                 project_saved, project_name_used = self.save_project_to_gpkg(
                     original_project, self.gpkg_path, processed_layers
                 )
                 
                 if project_saved:
-                    self.message.emit(f"✅ Project saved inside GeoPackage as: {project_name_used}")
+                    self._log(f"✅ Project saved inside GeoPackage as: {project_name_used}")
                 else:
-                    self.message.emit("❌ Could not save project inside GeoPackage")
-                self.progress.emit(95)
+                    self._log("❌ Could not save project inside GeoPackage")
+                self._set_progress(95)
             
             # Prepare layer data source updates (only for packageable layers)
-            self.message.emit("Preparing layer data source updates...")
+            self._log("Preparing layer data source updates...")
             layer_updates = []
+            # Validated here so the GUI thread never waits on the GeoPackage
+            present_tables = list_gpkg_tables(self._gpkg_connection()) if gpkg_exists else set()
             
             for processed_info in processed_layers:
                 # Only update data sources for packageable layers
@@ -212,32 +296,69 @@ class PackagingThread(QThread):
                             'layer_name': layer_name,
                             'provider': provider,
                             'gpkg_layer_name': gpkg_layer_name,
-                            'is_packageable': True
+                            'is_packageable': True,
+                            'is_valid': gpkg_layer_name.lower() in present_tables
                         })
                     except Exception as e:
-                        self.message.emit(f"⚠️ Could not prepare data source update for {layer_name}: {str(e)}")
+                        self._log(f"⚠️ Could not prepare data source update for {layer_name}: {str(e)}")
             
             # Emit signal with layer updates (will be handled in main thread)
+            self._flush_messages()
             self.layer_updates_signal.emit(layer_updates)
             
             # Build result message
-            packageable_names = [p['original_name'] for p in processed_layers if p['is_packageable']]
-            non_packageable_names = [p['original_name'] for p in processed_layers if not p['is_packageable']]
-            
             result_message = self._build_result_message(
-                packageable_names, 
+                packaged_names, 
                 failed_layers, 
-                non_packageable_names, 
+                preserved_names, 
                 len(layer_updates), 
                 project_name_used, 
                 self.gpkg_path
             )
 
-            self.progress.emit(100)
-            self.finished_signal.emit(True, result_message)
+            self._set_progress(100)
+            self._finish(True, result_message)
             
         except Exception as e:
-            self.finished_signal.emit(False, f"Unexpected error: {str(e)}")
+            self._finish(False, f"Unexpected error: {str(e)}")
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _log(self, text):
+        """Queue a log message, emitting queued messages at most every MESSAGE_FLUSH_INTERVAL"""
+        self._pending_msgs.append(text)
+        if time.monotonic() - self._last_flush >= MESSAGE_FLUSH_INTERVAL:
+            self._flush_messages()
+
+    def _flush_messages(self):
+        """Emit all queued log messages as a single signal"""
+        if self._pending_msgs:
+            self.message.emit("\n".join(self._pending_msgs))
+            self._pending_msgs = []
+        self._last_flush = time.monotonic()
+
+    def _set_progress(self, value):
+        """Emit progress only when the percentage changes"""
+        if value != self._last_progress:
+            self._last_progress = value
+            self.progress.emit(value)
+
+    def _finish(self, success, message):
+        """Flush queued log messages, then report the result"""
+        self._flush_messages()
+        self.finished_signal.emit(success, message)
+
+    def _gpkg_connection(self):
+        """SQLite connection to the output GeoPackage, shared for the whole run
+
+        Only call it once the file exists, sqlite3 would create an empty
+        non-GeoPackage file otherwise.
+        """
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.gpkg_path)
+        return self._conn
     
     def is_layer_packageable(self, layer):
         """
@@ -250,20 +371,16 @@ class PackagingThread(QThread):
                 return False
             
             # Check for unsupported providers (WMS, WFS, etc.)
-            provider = layer.dataProvider().name().lower() if layer.dataProvider() else ''
-            unsupported_providers = [
-                'wms', 'wfs', 'wcs', 'wmts', 'arcgismapserver', 
-                'arcgisfeatureserver', 'vectortile', 'mesh', 'pointcloud'
-            ]
+            dp = layer.dataProvider()
+            provider = dp.name().lower() if dp else ''
             
-            if any(unsupported in provider for unsupported in unsupported_providers):
+            if any(unsupported in provider for unsupported in _UNSUPPORTED_PROVIDERS):
                 return False  # These layers can't be stored in GPKG but will be in project
             
             if layer.type() == QgsMapLayerType.VectorLayer:
                 return True  # Vector layers can be packaged
             
             if layer.type() == QgsMapLayerType.RasterLayer:
-                dp = layer.dataProvider()
                 # Check if it's a file-based raster that can be packaged
                 if provider in ['gdal', 'ogr']:
                     return dp and dp.xSize() > 0 and dp.ySize() > 0
@@ -283,7 +400,7 @@ class PackagingThread(QThread):
             project_name = self.project_name or original_project.baseName() or "qgis_project"
             project_name_cleaned = self.clean_project_name(project_name)
             
-            self.message.emit(f"Saving project as: {project_name_cleaned}")
+            self._log(f"Saving project as: {project_name_cleaned}")
             
             # 2. Create a completely new temporary project
             temp_project = QgsProject()
@@ -295,6 +412,10 @@ class PackagingThread(QThread):
             
             # 4. Add ALL layers to temporary project (both packageable and non-packageable)
             layer_id_map = {}
+            style_doc = QDomDocument()
+            # Styles are copied from the original layers, skip default style lookups
+            vector_options = QgsVectorLayer.LayerOptions(False)
+            raster_options = QgsRasterLayer.LayerOptions(False)
             
             for processed_info in processed_layers_info:
                 original_lyr = processed_info['original_layer']
@@ -306,56 +427,47 @@ class PackagingThread(QThread):
                     # For packageable layers: create new layer with GPKG source
                     if original_lyr.type() == QgsMapLayerType.VectorLayer:
                         data_source = f"{gpkg_path}|layername={gpkg_layer_name}"
-                        new_lyr = QgsVectorLayer(data_source, original_name, "ogr")
+                        new_lyr = QgsVectorLayer(data_source, original_name, "ogr", vector_options)
                     elif original_lyr.type() == QgsMapLayerType.RasterLayer:
                         data_source = f"GPKG:{gpkg_path}:{gpkg_layer_name}"
-                        new_lyr = QgsRasterLayer(data_source, original_name, "gdal")
+                        new_lyr = QgsRasterLayer(data_source, original_name, "gdal", raster_options)
                     else:
                         continue
                     
                     if new_lyr and new_lyr.isValid():
-                        # Copy layer style using QgsMapLayerStyle
-                        style = QgsMapLayerStyle()
-                        style.readFromLayer(original_lyr)
-                        style.writeToLayer(new_lyr)
+                        # Copy layer style
+                        self._copy_layer_style(original_lyr, new_lyr, style_doc)
                         
                         # Add to temporary project
                         temp_project.addMapLayer(new_lyr, False)
                         layer_id_map[original_lyr.id()] = new_lyr.id()
-                        self.message.emit(f"✅ Added GPKG layer: {original_name}")
+                        self._log(f"✅ Added GPKG layer: {original_name}")
                     else:
-                        self.message.emit(f"⚠️ Failed to create GPKG layer: {original_name}")
+                        self._log(f"⚠️ Failed to create GPKG layer: {original_name}")
                 else:
                     # For non-packageable layers (WMS, etc.): clone the original layer
                     try:
-                        # Clone the layer to preserve its original source and properties
-                        if original_lyr.type() == QgsMapLayerType.VectorLayer:
-                            new_lyr = QgsVectorLayer(original_lyr.source(), original_name, original_lyr.providerType())
-                        elif original_lyr.type() == QgsMapLayerType.RasterLayer:
-                            new_lyr = QgsRasterLayer(original_lyr.source(), original_name, original_lyr.providerType())
-                        else:
-                            continue
+                        # Clone the layer to preserve its original source, style and properties
+                        new_lyr = original_lyr.clone()
                         
                         if new_lyr and new_lyr.isValid():
-                            # Copy layer style
-                            style = QgsMapLayerStyle()
-                            style.readFromLayer(original_lyr)
-                            style.writeToLayer(new_lyr)
+                            new_lyr.setName(original_name)
                             
                             # Add to temporary project
                             temp_project.addMapLayer(new_lyr, False)
                             layer_id_map[original_lyr.id()] = new_lyr.id()
-                            self.message.emit(f"📌 Preserved non-packageable layer: {original_name}")
+                            self._log(f"📌 Preserved non-packageable layer: {original_name}")
                         else:
-                            self.message.emit(f"⚠️ Failed to preserve non-packageable layer: {original_name}")
+                            self._log(f"⚠️ Failed to preserve non-packageable layer: {original_name}")
                     except Exception as e:
-                        self.message.emit(f"⚠️ Error preserving non-packageable layer {original_name}: {str(e)}")
+                        self._log(f"⚠️ Error preserving non-packageable layer {original_name}: {str(e)}")
             
             # 5. Copy layer tree structure for ALL layers
             self._copy_layer_tree(original_project, temp_project, layer_id_map)
             
             # 6. Use the native QgsProject storage mechanism for GPKG
-            self.message.emit("Writing project to GeoPackage using native storage...")
+            self._log("Writing project to GeoPackage using native storage...")
+            self._flush_messages()
             
             # Create the project storage URI for GeoPackage
             storage_uri = f"geopackage:{gpkg_path}?projectName={project_name_cleaned}"
@@ -363,78 +475,27 @@ class PackagingThread(QThread):
             # Save using the storage mechanism
             save_success = temp_project.write(storage_uri)
             
+            # The native storage owns qgis_projects: it stores the project as
+            # .qgz data, which raw project XML written there would overwrite
             if save_success:
-                self.message.emit(f"✅ Project successfully saved to GeoPackage")
-                # Also manually register in qgis_projects table for compatibility
-                self._register_project_in_gpkg(temp_project, gpkg_path, project_name_cleaned)
+                self._log(f"✅ Project successfully saved to GeoPackage")
                 return True, project_name_cleaned
             else:
-                self.message.emit("❌ Native GeoPackage storage failed, trying alternative method...")
-                # Fallback: Use direct SQLite approach
-                return self._save_project_direct_sqlite(temp_project, gpkg_path, project_name_cleaned)
+                self._log("❌ Native GeoPackage storage failed")
+                return False, None
             
         except Exception as e:
-            self.message.emit(f"❌ Project saving error: {str(e)}")
+            self._log(f"❌ Project saving error: {str(e)}")
             return False, None
 
-    def _save_project_direct_sqlite(self, project, gpkg_path, project_name):
-        """Alternative method: Save project directly to SQLite database"""
-        try:
-            self.message.emit("Using direct SQLite method to save project...")
-            
-            # Create project XML
-            doc = QDomDocument("qgis")
-            context = QgsReadWriteContext()
-            project.write(doc, context)
-            project_xml = doc.toString()
-            
-            # Connect to GPKG and save project
-            with closing(sqlite3.connect(gpkg_path)) as conn:
-                cursor = conn.cursor()
-                
-                # Create qgis_projects table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS qgis_projects (
-                        name TEXT PRIMARY KEY,
-                        metadata TEXT,
-                        content BLOB
-                    )
-                """)
-                
-                # Check if project already exists
-                cursor.execute("SELECT name FROM qgis_projects WHERE name = ?", (project_name,))
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # Update existing project
-                    cursor.execute("""
-                        UPDATE qgis_projects 
-                        SET metadata = ?, content = ? 
-                        WHERE name = ?
-                    """, (f"QGIS Project: {project_name}", project_xml, project_name))
-                else:
-                    # Insert new project
-                    cursor.execute("""
-                        INSERT INTO qgis_projects (name, metadata, content)
-                        VALUES (?, ?, ?)
-                    """, (project_name, f"QGIS Project: {project_name}", project_xml))
-                
-                conn.commit()
-                
-                # Verify the project was saved
-                cursor.execute("SELECT name FROM qgis_projects WHERE name = ?", (project_name,))
-                saved = cursor.fetchone()
-                
-                if saved:
-                    self.message.emit(f"✅ Project successfully saved via direct SQLite method: {project_name}")
-                    return True, project_name
-                else:
-                    self.message.emit("❌ Project verification failed")
-                    return False, None
-                
-        except Exception as e:
-            self.message.emit(f"❌ Direct SQLite method failed: {str(e)}")
-            return False, None
+    def _copy_layer_style(self, source_layer, dest_layer, doc):
+        """Copy the style of one layer to another through a reused QDomDocument"""
+        doc.clear()
+        error = source_layer.exportNamedStyle(doc)
+        if not error:
+            ok, error = dest_layer.importNamedStyle(doc)
+        if error:
+            self._log(f"⚠️ Could not copy style of {source_layer.name()}: {error}")
 
     def _copy_layer_tree(self, source_project, dest_project, layer_id_map):
         """Copy layer tree structure with proper layer ID mapping for ALL layers"""
@@ -445,15 +506,18 @@ class PackagingThread(QThread):
             # Clear destination tree
             dest_root.removeAllChildren()
             
+            # Resolve the new layers once instead of per tree node
+            id_to_layer = {lid: dest_project.mapLayer(lid) for lid in layer_id_map.values()}
+            
             # Function to recursively copy tree structure
             def copy_tree_node(source_node, dest_parent):
                 for child in source_node.children():
                     if QgsLayerTree.isLayer(child):
                         # Layer node
                         original_layer_id = child.layerId()
-                        if original_layer_id in layer_id_map:
-                            new_layer_id = layer_id_map[original_layer_id]
-                            new_layer = dest_project.mapLayer(new_layer_id)
+                        new_layer_id = layer_id_map.get(original_layer_id)
+                        if new_layer_id:
+                            new_layer = id_to_layer.get(new_layer_id)
                             if new_layer:
                                 new_layer_node = QgsLayerTreeLayer(new_layer)
                                 new_layer_node.setName(child.name())
@@ -471,50 +535,14 @@ class PackagingThread(QThread):
             copy_tree_node(source_root, dest_root)
             
         except Exception as e:
-            self.message.emit(f"⚠️ Error copying layer tree: {str(e)}")
+            self._log(f"⚠️ Error copying layer tree: {str(e)}")
 
-    def _register_project_in_gpkg(self, project, gpkg_path, project_name):
-        """Ensure project is properly registered in GeoPackage qgis_projects table"""
-        try:
-            # Create project XML
-            doc = QDomDocument("qgis")
-            context = QgsReadWriteContext()
-            project.write(doc, context)
-            project_xml = doc.toString()
-            
-            # Connect to GPKG and register project
-            with closing(sqlite3.connect(gpkg_path)) as conn:
-                cursor = conn.cursor()
-                
-                # Create qgis_projects table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS qgis_projects (
-                        name TEXT PRIMARY KEY,
-                        metadata TEXT,
-                        content BLOB
-                    )
-                """)
-                
-                # Add project to table
-                cursor.execute("""
-                    INSERT OR REPLACE INTO qgis_projects (name, metadata, content)
-                    VALUES (?, ?, ?)
-                """, (project_name, f"QGIS Project: {project_name}", project_xml))
-                
-                conn.commit()
-                self.message.emit(f"✅ Project registered in qgis_projects table: {project_name}")
-                return True
-                
-        except Exception as e:
-            self.message.emit(f"⚠️ Could not register project in qgis_projects table: {str(e)}")
-            return False
-    
     def clean_project_name(self, name):
         """Clean project name for GPKG compatibility"""
-        cleaned = re.sub(r'[^\w\s-]', '', name)
+        cleaned = _NON_WORDSPACE.sub('', name)
         cleaned = cleaned.strip()
         cleaned = cleaned.replace(' ', '_')
-        cleaned = re.sub(r'_+', '_', cleaned)
+        cleaned = _UNDERSCORES.sub('_', cleaned)
         if not cleaned:
             cleaned = "qgis_project"
         if len(cleaned) > 100:
@@ -524,8 +552,8 @@ class PackagingThread(QThread):
     def clean_layer_name(self, name):
         """Clean layer name for GPKG compatibility"""
         # More robust cleaning for SQL table names
-        cleaned = re.sub(r'[^a-zA-Z0-9_]', '_', name)
-        cleaned = re.sub(r'_+', '_', cleaned)
+        cleaned = _NON_SQLNAME.sub('_', name)
+        cleaned = _UNDERSCORES.sub('_', cleaned)
         cleaned = cleaned.strip('_')
         
         # Ensure name starts with letter or underscore
@@ -591,6 +619,24 @@ class PackDialog(QDialog):
         
         # Thread for packaging
         self.thread = None
+        self._last_progress_ts = 0.0
+        
+        # Throttled progress values are applied later, latest value wins
+        self._pending_progress = 0
+        self._progress_timer = QTimer(self)
+        self._progress_timer.setSingleShot(True)
+        self._progress_timer.timeout.connect(self._apply_progress)
+        
+        # Project location, used for default names and the browse dialog
+        self._project_file = QgsProject.instance().fileName()
+        self._project_dir = os.path.dirname(self._project_file) if self._project_file else os.path.expanduser("~")
+        
+        # Log lines are buffered and appended in batches
+        self._log_buf = []
+        self._log_timer = QTimer(self)
+        self._log_timer.setSingleShot(True)
+        self._log_timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self._log_timer.timeout.connect(self._flush_log)
         
         self.setup_ui()
 
@@ -645,28 +691,14 @@ class PackDialog(QDialog):
         config_group.setLayout(config_layout)
         splitter.addWidget(config_group)
         
-        # Bottom section - Progress and logs
-        progress_group = QGroupBox("Progress")
-        progress_layout = QVBoxLayout()
-        
-        # Progress bar
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setVisible(False)
-        progress_layout.addWidget(self.progress_bar)
-        
-        # Status messages
-        self.status_label = QLabel("Ready to package project...")
-        progress_layout.addWidget(self.status_label)
-        
-        # Log area
-        self.log_area = QTextEdit()
-        self.log_area.setMaximumHeight(150)
-        self.log_area.setReadOnly(True)
-        progress_layout.addWidget(QLabel("Log:"))
-        progress_layout.addWidget(self.log_area)
-        
-        progress_group.setLayout(progress_layout)
-        splitter.addWidget(progress_group)
+        # Bottom section - Progress and logs, built on first use by
+        # _ensure_progress_group(); the placeholder keeps the splitter geometry
+        self.splitter = splitter
+        self.progress_group = None
+        self.progress_bar = None
+        self.status_label = None
+        self.log_area = None
+        splitter.addWidget(QWidget())
         
         # Set splitter sizes (2/3 for config, 1/3 for progress)
         splitter.setSizes([300, 200])
@@ -696,6 +728,37 @@ class PackDialog(QDialog):
         # Update UI based on initial state
         self.on_store_project_toggled(self.chk_store_proj.isChecked())
 
+    def _ensure_progress_group(self):
+        """Create the progress bar and log area the first time they are needed"""
+        if self.progress_group is not None:
+            return
+        
+        progress_group = QGroupBox("Progress")
+        progress_layout = QVBoxLayout()
+        
+        # Progress bar
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        progress_layout.addWidget(self.progress_bar)
+        
+        # Status messages
+        self.status_label = QLabel("Ready to package project...")
+        progress_layout.addWidget(self.status_label)
+        
+        # Log area
+        self.log_area = QPlainTextEdit()
+        self.log_area.setMaximumHeight(150)
+        self.log_area.setReadOnly(True)
+        self.log_area.setMaximumBlockCount(LOG_MAX_LINES)
+        progress_layout.addWidget(QLabel("Log:"))
+        progress_layout.addWidget(self.log_area)
+        
+        progress_group.setLayout(progress_layout)
+        placeholder = self.splitter.replaceWidget(1, progress_group)
+        if placeholder:
+            placeholder.deleteLater()
+        self.progress_group = progress_group
+
     def generate_gpkg_filename(self, base_name):
         """Generate GPKG filename in format 'GPKG-ORIGINALNAME'"""
         if base_name.upper().startswith('GPKG-'):
@@ -703,8 +766,8 @@ class PackDialog(QDialog):
         if base_name.upper().startswith('QGIS_'):
             base_name = base_name[5:]
             
-        cleaned_name = re.sub(r'[^\w\-_.]', '_', base_name)
-        cleaned_name = re.sub(r'_+', '_', cleaned_name)
+        cleaned_name = _NON_FILENAME.sub('_', base_name)
+        cleaned_name = _UNDERSCORES.sub('_', cleaned_name)
         cleaned_name = cleaned_name.strip('_')
         
         gpkg_name = f"GPKG-{cleaned_name}"
@@ -717,29 +780,22 @@ class PackDialog(QDialog):
         if base_name.upper().startswith('QGIS_'):
             base_name = base_name[5:]
             
-        cleaned_name = re.sub(r'[^\w]', '_', base_name)
-        cleaned_name = re.sub(r'_+', '_', cleaned_name)
+        cleaned_name = _NON_WORD.sub('_', base_name)
+        cleaned_name = _UNDERSCORES.sub('_', cleaned_name)
         cleaned_name = cleaned_name.strip('_')
         
         return cleaned_name
 
     def set_default_names(self):
         """Set default filename and project name based on project"""
-        project = QgsProject.instance()
-        project_file = project.fileName()
-        
-        if project_file:
-            original_name = os.path.splitext(os.path.basename(project_file))[0]
-            gpkg_filename = self.generate_gpkg_filename(original_name)
-            default_path = os.path.join(os.path.dirname(project_file), f"{gpkg_filename}.gpkg")
-            project_name = self.generate_project_name(original_name)
-            self.project_name_edit.setText(project_name)
+        if self._project_file:
+            original_name = os.path.splitext(os.path.basename(self._project_file))[0]
         else:
             original_name = "project"
-            gpkg_filename = self.generate_gpkg_filename(original_name)
-            default_path = os.path.join(os.path.expanduser("~"), f"{gpkg_filename}.gpkg")
-            self.project_name_edit.setText(self.generate_project_name(original_name))
         
+        gpkg_filename = self.generate_gpkg_filename(original_name)
+        default_path = os.path.join(self._project_dir, f"{gpkg_filename}.gpkg")
+        self.project_name_edit.setText(self.generate_project_name(original_name))
         self.path_edit.setText(default_path)
 
     def on_store_project_toggled(self, checked):
@@ -752,7 +808,7 @@ class PackDialog(QDialog):
             directory = os.path.dirname(current_path)
             suggested_filename = os.path.basename(current_path)
         else:
-            directory = os.path.expanduser("~")
+            directory = self._project_dir
             suggested_filename = "GPKG-project.gpkg"
         
         fn, _ = QFileDialog.getSaveFileName(
@@ -766,22 +822,35 @@ class PackDialog(QDialog):
             self.path_edit.setText(fn)
             
             if not self.project_name_edit.isModified():
+                # generate_project_name strips the GPKG- prefix itself
                 base_name = os.path.splitext(os.path.basename(fn))[0]
-                if base_name.upper().startswith("GPKG-"):
-                    original_name = base_name[5:]
-                else:
-                    original_name = base_name
-                
-                project_name = self.generate_project_name(original_name)
+                project_name = self.generate_project_name(base_name)
                 self.project_name_edit.setText(project_name)
 
     def log_message(self, message):
-        """Add message to log area"""
-        self.log_area.append(f"• {message}")
-        cursor = self.log_area.textCursor()
-        cursor.movePosition(cursor.End)
-        self.log_area.setTextCursor(cursor)
-        QgsApplication.processEvents()
+        """Queue message for the log area, one line per entry"""
+        self._log_buf.extend(f"• {line}" for line in message.split("\n"))
+        if not self._log_timer.isActive():
+            self._log_timer.start()
+
+    def _flush_log(self):
+        """Append all queued log lines to the log area at once"""
+        if not self._log_buf:
+            return
+        # Nothing to lay out while the dialog is minimized; keep the newest
+        # lines queued for changeEvent, bounded like the log area itself
+        if self.isMinimized():
+            del self._log_buf[:-LOG_MAX_LINES]
+            return
+        self.log_area.appendPlainText("\n".join(self._log_buf))
+        self._log_buf = []
+
+    def changeEvent(self, event):
+        """Flush log lines queued while the dialog was minimized"""
+        super().changeEvent(event)
+        if event.type() == QEvent.WindowStateChange and not self.isMinimized() and \
+                self._log_buf and self.log_area is not None:
+            self._flush_log()
 
     def start_packaging(self):
         """Start the packaging process"""
@@ -806,6 +875,8 @@ class PackDialog(QDialog):
                 QMessageBox.critical(self, "Error", f"Cannot create directory: {str(e)}")
                 return
 
+        self._ensure_progress_group()
+        
         # Disable UI during packaging
         self.package_btn.setEnabled(False)
         self.cancel_btn.setEnabled(True)
@@ -814,24 +885,21 @@ class PackDialog(QDialog):
         self.progress_bar.setValue(0)
         
         # Clear log
+        self._log_buf = []
         self.log_area.clear()
         self.log_message("Starting packaging process...")
         
         # Count layers
         project = QgsProject.instance()
-        layers = list(project.mapLayers().values())
+        layers_map = project.mapLayers()
+        total_count = len(layers_map)
         
-        supported_count = 0
-        unsupported_count = 0
+        providers = (lyr.dataProvider() for lyr in layers_map.values())
+        unsupported_count = sum(1 for dp in providers
+                                if dp and _WEB_SERVICE_PROVIDERS.search(dp.name().lower()))
+        supported_count = total_count - unsupported_count
         
-        for lyr in layers:
-            provider = lyr.dataProvider().name().lower() if lyr.dataProvider() else 'unknown'
-            if any(unsupported in provider for unsupported in ['wms', 'wfs', 'wcs', 'wmts', 'arcgismapserver']):
-                unsupported_count += 1
-            else:
-                supported_count += 1
-        
-        self.log_message(f"Found {len(layers)} total layers")
+        self.log_message(f"Found {total_count} total layers")
         self.log_message(f"✅ Packageable layers: {supported_count}")
         self.log_message(f"📌 Non-packageable layers (WMS, etc.): {unsupported_count}")
         
@@ -846,83 +914,81 @@ class PackDialog(QDialog):
         
         # Start packaging thread
         self.thread = PackagingThread(gpkg_path, self.chk_store_proj.isChecked(), project_name)
-        self.thread.progress.connect(self.progress_bar.setValue)
+        self._last_progress_ts = 0.0
+        self.thread.progress.connect(self._on_progress)
         self.thread.message.connect(self.log_message)
         self.thread.finished_signal.connect(self.packaging_finished)
         self.thread.layer_updates_signal.connect(self.update_layer_sources)
         self.thread.start()
 
+    def _on_progress(self, value):
+        """Update the progress bar at most every PROGRESS_UPDATE_INTERVAL seconds"""
+        self._pending_progress = value
+        wait = PROGRESS_UPDATE_INTERVAL - (time.monotonic() - self._last_progress_ts)
+        if wait <= 0 or value == 100:
+            self._progress_timer.stop()
+            self._apply_progress()
+        elif not self._progress_timer.isActive():
+            self._progress_timer.start(int(wait * 1000))
+
+    def _apply_progress(self):
+        """Show the latest progress value"""
+        self.progress_bar.setValue(self._pending_progress)
+        self._last_progress_ts = time.monotonic()
+
     def update_layer_sources(self, layer_updates):
         """Update layer data sources in main thread (thread-safe)"""
-        self.log_message("Updating layer data sources...")
+        log_lines = ["Updating layer data sources..."]
         updated_count = 0
         failed_count = 0
         
-        # First, test all data sources to ensure they're valid
-        valid_updates = []
+        layers_by_id = QgsProject.instance().mapLayers()
+        provider_options = QgsDataProvider.ProviderOptions()
+        
         for update_info in layer_updates:
             layer_id = update_info['layer_id']
             data_source = update_info['data_source']
             layer_name = update_info['layer_name']
             provider = update_info['provider']
             
-            try:
-                # Test the data source first
-                test_layer = None
-                if provider == "ogr":
-                    test_layer = QgsVectorLayer(data_source, "test_layer", provider)
-                elif provider == "gdal":
-                    test_layer = QgsRasterLayer(data_source, "test_layer", provider)
-                
-                if test_layer and test_layer.isValid():
-                    valid_updates.append(update_info)
-                    self.log_message(f"✅ Data source valid: {layer_name}")
-                else:
-                    self.log_message(f"⚠️ Invalid data source for: {layer_name}")
-                    failed_count += 1
-                    
-                if test_layer:
-                    del test_layer
-                    
-            except Exception as e:
-                self.log_message(f"❌ Error testing data source for {layer_name}: {str(e)}")
+            # Validity was determined by the packaging thread
+            if not update_info['is_valid']:
+                log_lines.append(f"⚠️ Invalid data source for: {layer_name}")
                 failed_count += 1
-        
-        # Now update the actual layers
-        for update_info in valid_updates:
-            layer_id = update_info['layer_id']
-            data_source = update_info['data_source']
-            layer_name = update_info['layer_name']
-            provider = update_info['provider']
+                continue
             
             try:
                 # Get layer from project
-                layer = QgsProject.instance().mapLayer(layer_id)
+                layer = layers_by_id.get(layer_id)
                 if not layer:
-                    self.log_message(f"⚠️ Layer not found: {layer_name}")
+                    log_lines.append(f"⚠️ Layer not found: {layer_name}")
                     failed_count += 1
                     continue
                 
                 # Update the layer's data source
-                layer.setDataSource(data_source, layer_name, provider, QgsDataProvider.ProviderOptions())
+                layer.setDataSource(data_source, layer_name, provider, provider_options)
                 
                 if layer.isValid():
-                    self.log_message(f"✅ Updated: {layer_name}")
+                    log_lines.append(f"✅ Updated: {layer_name}")
                     updated_count += 1
                 else:
-                    self.log_message(f"⚠️ Layer became invalid after update: {layer_name}")
+                    log_lines.append(f"⚠️ Layer became invalid after update: {layer_name}")
                     failed_count += 1
                         
             except Exception as e:
-                self.log_message(f"❌ Error updating {layer_name}: {str(e)}")
+                log_lines.append(f"❌ Error updating {layer_name}: {str(e)}")
                 failed_count += 1
         
-        self.log_message(f"✅ Successfully updated {updated_count} layers")
+        log_lines.append(f"✅ Successfully updated {updated_count} layers")
         if failed_count > 0:
-            self.log_message(f"⚠️ Failed to update {failed_count} layers")
+            log_lines.append(f"⚠️ Failed to update {failed_count} layers")
+        
+        # Hand all lines to the log in one call
+        self.log_message("\n".join(log_lines))
 
     def packaging_finished(self, success, message):
         """Handle packaging completion"""
+        self._progress_timer.stop()
         self.progress_bar.setValue(100 if success else 0)
         
         # Re-enable UI
@@ -932,9 +998,17 @@ class PackDialog(QDialog):
         
         if success:
             self.log_message("✅ Packaging completed successfully!")
-            QMessageBox.information(self, "Success", message)
         else:
             self.log_message(f"❌ Packaging failed: {message}")
+        
+        # Show the complete log once, before the modal result box
+        self._log_timer.stop()
+        self._flush_log()
+        self.log_area.repaint()
+        
+        if success:
+            QMessageBox.information(self, "Success", message)
+        else:
             QMessageBox.critical(self, "Error", message)
 
     def reject(self):
@@ -982,31 +1056,122 @@ class MajidGpkg:
 
 
 # Helper functions
-def is_layer_in_gpkg(filename, layerName):
-    """Check if layer already exists in GeoPackage"""
+@contextmanager
+def gpkg_write_options(new_file):
+    """Apply GPKG_WRITE_CONFIG to GDAL connections opened by the current thread
+
+    GPKG_NEW_FILE_CONFIG is added when new_file is True, i.e. the GeoPackage
+    did not exist before this run.
+    """
+    config = dict(GPKG_WRITE_CONFIG)
+    if new_file:
+        config.update(GPKG_NEW_FILE_CONFIG)
+    previous = {key: gdal.GetThreadLocalConfigOption(key) for key in config}
+    for key, value in config.items():
+        gdal.SetThreadLocalConfigOption(key, value)
     try:
-        ds = gdal.OpenEx(filename)
-        if ds is None:
-            return False
-        res = bool(ds.GetLayerByName(layerName) or ds.GetLayerByName(layerName.upper()))
-    except (AttributeError, RuntimeError):
-        res = False
+        yield
     finally:
-        if 'ds' in locals() and ds:
-            del ds
-    return res
+        for key, value in previous.items():
+            gdal.SetThreadLocalConfigOption(key, value)
+
+
+def list_gpkg_tables(conn):
+    """Return the lower-cased names of all tables in a GeoPackage, empty if it cannot be read
+
+    SQLite table names are case-insensitive, so look names up with .lower().
+    """
+    try:
+        rows = conn.execute(
+            "SELECT table_name FROM gpkg_contents "
+            "UNION SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+    except sqlite3.Error:
+        return set()
+    return {row[0].lower() for row in rows}
 
 
-def write_layer(layer, filename, tc, layerName):
-    """Write layer to GeoPackage"""
+def ogr_source(layer):
+    """Return (path, layer) of an OGR file layer that can be copied as is, else None"""
+    if layer.providerType() != 'ogr' or layer.isModified() or layer.subsetString():
+        return None
+    # Joined/virtual fields and CRS overrides only exist on the QGIS side
+    if any(layer.fields().fieldOrigin(idx) != QgsFields.OriginProvider
+           for idx in layer.attributeList()):
+        return None
+    dp = layer.dataProvider()
+    if layer.crs() != dp.crs():
+        return None
+    # QGIS reports UTF-8 when it reads the text as GDAL decodes it; any other
+    # encoding is a user override that only QGIS applies
+    if dp.encoding().upper().replace('-', '') != 'UTF8':
+        return None
+
+    parts = QgsProviderRegistry.instance().decodeUri('ogr', layer.source())
+    # Geometry type filters, archives and open options aren't carried over
+    # by a plain copy of the source layer
+    if parts.get('geometryType') or parts.get('vsiPrefix') or parts.get('openOptions'):
+        return None
+    path = parts.get('path')
+    if not path or not os.path.isfile(path):
+        return None
+    src_layer = parts.get('layerName') or parts.get('layerId') or 0
+    return path, src_layer
+
+
+def copy_ogr_layer(src_path, src_layer, filename, layerName, gpkg_exists):
+    """Copy an OGR layer to GeoPackage natively, committing every FEATURES_PER_TRANSACTION features"""
+    src_ds = dst_ds = None
+    try:
+        src_ds = gdal.OpenEx(src_path, gdal.OF_VECTOR)
+        src_lyr = src_ds.GetLayer(src_layer) if src_ds else None
+        if src_lyr is None:
+            return (True, f"Cannot read layer '{src_layer}' from {src_path}")
+
+        geometry_type = None
+        if src_ds.GetDriver().ShortName == 'ESRI Shapefile' and \
+                ogr.GT_Flatten(src_lyr.GetGeomType()) in (ogr.wkbLineString, ogr.wkbPolygon):
+            # Shapefiles mix single and multi parts; QGIS reports them as multi
+            geometry_type = 'PROMOTE_TO_MULTI'
+
+        options = gdal.VectorTranslateOptions(
+            # -gt as a raw option: the transactionSize keyword needs GDAL 3.7
+            options=['-gt', str(FEATURES_PER_TRANSACTION)],
+            format='GPKG',
+            # Same behaviour as QgsVectorFileWriter.CreateOrOverwriteLayer
+            accessMode='overwrite' if gpkg_exists else None,
+            layers=[src_lyr.GetName()],
+            layerName=layerName,
+            geometryType=geometry_type,
+            layerCreationOptions=['SPATIAL_INDEX=NO', 'FID=fid'])
+        gdal.ErrorReset()
+        dst_ds = gdal.VectorTranslate(filename, src_ds, options=options)
+        if dst_ds is None:
+            return (True, gdal.GetLastErrorMsg() or f"Cannot write table '{layerName}'")
+        return (False, '')
+    except (RuntimeError, TypeError) as e:
+        # TypeError: an option this GDAL version's bindings don't know
+        return (True, str(e))
+    finally:
+        # Closing the datasets flushes the GeoPackage
+        src_ds = dst_ds = None
+
+
+def write_layer(layer, filename, tc, layerName, gpkg_exists):
+    """Write layer to GeoPackage, gpkg_exists tells whether the file was already created"""
     err = (False, '') 
     
     if layer.type() == QgsMapLayerType.VectorLayer:
+        source = ogr_source(layer)
+        if source:
+            return copy_ogr_layer(source[0], source[1], filename, layerName, gpkg_exists)
+
         options = QgsVectorFileWriter.SaveVectorOptions()
         options.layerName = layerName
+        # The RTree is filled in bulk by create_spatial_index() afterwards
+        options.layerOptions = ['SPATIAL_INDEX=NO']
         options.attributes = [idx for idx in layer.attributeList()
                               if layer.fields().fieldOrigin(idx) == QgsFields.OriginProvider]
-        if os.path.exists(filename):
+        if gpkg_exists:
             options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
         
         if Qgis.QGIS_VERSION_INT >= 32000:
@@ -1028,6 +1193,9 @@ def write_layer(layer, filename, tc, layerName):
         pipe = QgsRasterPipe()
         pipe.set(dp.clone())
         pipe.insert(2, projector)
+        # The tile table is always new: its only index is the inline
+        # UNIQUE (zoom_level, tile_column, tile_row) constraint, which SQLite
+        # can't drop, so there is no index to defer until after the insert
         writer = QgsRasterFileWriter(filename)
         writer.setOutputFormat('GPKG')
         writer.setCreateOptions([
@@ -1050,38 +1218,49 @@ def write_layer(layer, filename, tc, layerName):
     return err
 
 
+def create_spatial_index(filename, layerName):
+    """Build the RTree spatial index of a GeoPackage layer, return False if it failed"""
+    ds = gdal.OpenEx(filename, gdal.OF_VECTOR | gdal.OF_UPDATE)
+    if ds is None:
+        return False
+
+    try:
+        layer = ds.GetLayerByName(layerName)
+        geom_col = layer.GetGeometryColumn() if layer else ''
+        if not geom_col:
+            return True
+        gdal.ErrorReset()
+        res = ds.ExecuteSQL(f"SELECT CreateSpatialIndex('{layerName}', '{geom_col}')")
+        if res is not None:
+            ds.ReleaseResultSet(res)
+        return gdal.GetLastErrorType() < gdal.CE_Failure
+    except RuntimeError:
+        return False
+    finally:
+        # Closing the dataset commits the index
+        ds = None
+
+
 def rename_raster_layer(filename, old_name, new_name):
     """Rename raster layer in GeoPackage SQLite database"""
+    # Only the ALTER TABLE needs the names in the SQL text, so restrict them
+    # to the characters clean_layer_name() produces
+    for name in (old_name, new_name):
+        if not name or _NON_SQLNAME.search(name):
+            raise ValueError(f"Invalid GeoPackage table name: {name!r}")
+    
     with closing(sqlite3.connect(filename, isolation_level=None)) as conn:
-        cursor = conn.cursor()
-        
-        sql_rename_table = f'ALTER TABLE "{old_name}" RENAME TO "{new_name}"'
-        cursor.execute(sql_rename_table)
-        
-        sql_update_contents = f'''
-            UPDATE gpkg_contents SET 
-                table_name = "{new_name}",
-                identifier = "{new_name}"
-            WHERE table_name = "{old_name}"
-        '''
-        cursor.execute(sql_update_contents)
-        
-        sql_update_tile_matrix_set = f'''
-            UPDATE gpkg_tile_matrix_set SET table_name = "{new_name}"
-            WHERE table_name = "{old_name}"
-        '''
-        cursor.execute(sql_update_tile_matrix_set)
-        
-        sql_update_tile_matrix = f'''
-            UPDATE gpkg_tile_matrix SET table_name = "{new_name}"
-            WHERE table_name = "{old_name}"
-        '''
-        cursor.execute(sql_update_tile_matrix)
-        
-        sql_update_extensions = f'''
-            UPDATE gpkg_extensions SET table_name = "{new_name}"
-            WHERE table_name = "{old_name}"
-        '''
-        cursor.execute(sql_update_extensions)
-        
-        conn.commit()
\ No newline at end of file
+        # One explicit transaction so the ALTER TABLE commits with the updates
+        with conn:
+            conn.execute("BEGIN")
+            
+            # Table names can't be bound as parameters (validated above)
+            conn.execute(f'ALTER TABLE "{old_name}" RENAME TO "{new_name}"')
+            
+            conn.execute(
+                "UPDATE gpkg_contents SET table_name = ?, identifier = ? WHERE table_name = ?",
+                (new_name, new_name, old_name))
+            for gpkg_table in _TILE_TABLE_REFERENCES:
+                conn.execute(
+                    f"UPDATE {gpkg_table} SET table_name = ? WHERE table_name = ?",
+                    (new_name, old_name))